@@ -21,6 +21,21 @@ def shannon(spec):
     spec = spec[spec > 0]
     return -np.sum(spec * np.log(spec)) 
 
+def shannon_batch(spec, axis=0):
+    '''
+    Shannon entropies of a batch of probability distributions
+
+    Args:
+        spec (ndarray): probability distributions, stacked along axis
+        axis (int): axis holding the probabilities of a single distribution
+
+    Returns:
+        S (ndarray): Shannon entropy of every distribution in spec
+    '''
+    spec = np.asarray(spec)
+    pos = spec > 0
+    return -np.sum(np.where(pos, spec * np.log(np.where(pos, spec, 1.)), 0.), axis=axis)
+
 def get_cost_fqi(gamma, Gamma, inactive_indices):
 
     '''
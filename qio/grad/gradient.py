@@ -147,7 +147,7 @@ def FQI_hess(gamma,Gamma,inactive_indices,active_indices, mu=0.):
 
 def FQI_display(gamma,Gamma,inactive_indices,verbose=True):
     cost_ = get_cost_fqi(gamma, Gamma, inactive_indices)
-    logger.info('FQI cost: ', cost_)
+    logger.info('FQI cost: %s', cost_)
 
     return cost_
             
@@ -196,6 +196,8 @@ def minimize_orb_corr_GD(gamma_, Gamma_, inactive_indices, active_indices, step_
     level_shift = level_shift_ave
 
     n_ae = np.sum(np.diag(gamma0)[2*active_indices])*2
+    # the 2RDM is rotated with the same shapes in every iteration, find the contraction path once
+    path, _ = np.einsum_path('ia,jb,kc,ld,abcd->ijkl',U0,U0,U0,U0,Gamma0,optimize='optimal')
     while np.abs(delta_cost) > thresh and n < max_cycle:
         n += 1
         grad = FQI_grad(gamma0,Gamma0,inactive_indices, active_indices)
@@ -209,9 +211,10 @@ def minimize_orb_corr_GD(gamma_, Gamma_, inactive_indices, active_indices, step_
         
         U = expm(X)
         U_tot = np.matmul(U,U_tot)
-        U_ = np.kron(U,np.eye(2))
-        gamma0_ = np.einsum('ia,jb,ab->ij',U_,U_,gamma0,optimize='optimal')
-        Gamma0_ = np.einsum('ia,jb,kc,ld,abcd->ijkl',U,U,U,U,Gamma0,optimize='optimal')
+        gamma0_ = np.zeros_like(gamma0)
+        for spin in range(2):
+            gamma0_[spin::2,spin::2] = U @ gamma0[spin::2,spin::2] @ U.T
+        Gamma0_ = np.einsum('ia,jb,kc,ld,abcd->ijkl',U,U,U,U,Gamma0,optimize=path)
         cost = get_cost_fqi(gamma0_,Gamma0_,inactive_indices)
         delta_cost = cost_old - cost
 
@@ -227,6 +230,6 @@ def minimize_orb_corr_GD(gamma_, Gamma_, inactive_indices, active_indices, step_
 
         cost_old = cost
         if n % 1 == 0:
-            logger.info("iteration:"+ str(n) + " max |grad| = "+str(np.max(abs(grad))) + " cost = " +str(cost))
+            logger.info("iteration:%d max |grad| = %s cost = %s", n, np.max(abs(grad)), cost)
 
     return U_tot, gamma0, Gamma0, mu
@@ -1,17 +1,59 @@
 import numpy as np
-import copy
 import sys
-from scipy.linalg import expm
+from scipy.special import xlogy
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
-from qio.entropy import shannon, get_cost_fqi
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional, the NumPy kernels below are used without it
+    njit = None
+
+from qio.entropy import shannon_batch, get_cost_fqi
 
 np.set_printoptions(threshold=sys.maxsize)
 
 logger = logging.getLogger('qio')
 
 
+def split_spin(gamma):
+
+    '''
+    Split a spin-orbital 1RDM into its contiguous spin-up and spin-down blocks
+
+    Args:
+        gamma (ndarray): 1RDM in spin-orbital indices
+
+    Returns:
+        gu (ndarray): spin-up 1RDM in spatial-orbital indices
+        gd (ndarray): spin-down 1RDM in spatial-orbital indices
+    '''
+
+    return np.ascontiguousarray(gamma[0::2,0::2]), np.ascontiguousarray(gamma[1::2,1::2])
+
+
+def merge_spin(gu, gd):
+
+    '''
+    Merge spin-up and spin-down blocks into a spin-orbital 1RDM
+
+    Args:
+        gu (ndarray): spin-up 1RDM in spatial-orbital indices
+        gd (ndarray): spin-down 1RDM in spatial-orbital indices
+
+    Returns:
+        gamma (ndarray): 1RDM in spin-orbital indices
+    '''
+
+    no = len(gu)
+    gamma = np.zeros((2*no,2*no))
+    gamma[0::2,0::2] = gu
+    gamma[1::2,1::2] = gd
+    return gamma
+
+
 def jacobi_cost(theta,i,j,rdm1,rdm2,inactive_indices):
 
     '''
@@ -29,38 +71,187 @@ def jacobi_cost(theta,i,j,rdm1,rdm2,inactive_indices):
 
     '''
 
-    
-    
-    cost_fun = 0
-    # two orbital rotation
-    u1 = np.array([[np.cos(theta),np.sin(theta)],[-np.sin(theta),np.cos(theta)]])
-        
-    indices = [i,j]
-
-    for k in indices:
-        if k in inactive_indices:
-            index = 1*(k==j)
-            nu = 0.
-            nd = 0.
-            nn = 0.
-            
-            for m in range(2):
-                for n in range(2):
-                    nu += u1[index,m]*u1[index,n]*rdm1[2*indices[m],2*indices[n]]     
-                    nd += u1[index,m]*u1[index,n]*rdm1[2*indices[m]+1,2*indices[n]+1]
-                    for p in range(2):
-                        for q in range(2):
-                            nn += u1[index,m]*u1[index,n]*u1[index,p]*u1[index,q]*rdm2[indices[m],indices[n],indices[p],indices[q]]
-        
-            # compute orbital entropy
-            spec = np.array([1-nu-nd+nn,nu-nn,nd-nn,nn])
-            cost_fun += shannon(spec)
-            
+    return jacobi_cost_batch(np.array([theta]),i,j,rdm1,rdm2,inactive_indices)[0]
+
+
+def jacobi_cost_batch(thetas,i,j,rdm1,rdm2,inactive_indices):
+
+    '''
+    Sum of orbital entropy of the two orbitals i and j for a whole array of rotational angles
+
+    Args:
+        thetas (ndarray): 1-D array of rotational angles
+        i,j (int): orbital indices
+        gamma (ndarray): current 1RDM
+        Gamma (ndarray): current 2RDM
+        inactive_indices (list): indices of inactive orbitals
 
-    return cost_fun
+    Returns:
+        cost_fun (ndarray): S(rho_i) + S(rho_j) for every angle in thetas
 
+    '''
 
-def jacobi_transform(gamma,Gamma,i,j,t):
+    g2u, g2d, G2 = _pair_blocks(i,j,rdm1,rdm2)
+    mask = np.array([i in inactive_indices, j in inactive_indices])
+
+    return _jac_cost_batch(_rotations(thetas),g2u,g2d,G2,mask)
+
+
+def _pair_blocks(i,j,rdm1,rdm2):
+    # spin-up and spin-down 1RDM blocks and 2RDM block restricted to orbitals i and j
+    ij = [i,j]
+    g2u = rdm1[np.ix_([2*i,2*j],[2*i,2*j])]
+    g2d = rdm1[np.ix_([2*i+1,2*j+1],[2*i+1,2*j+1])]
+    G2 = rdm2[np.ix_(ij,ij,ij,ij)]
+    return g2u, g2d, G2
+
+
+def _swap_pair_blocks(blocks):
+    # blocks of the pair (j,i) from the blocks of the pair (i,j)
+    g2u, g2d, G2 = blocks
+    return (np.ascontiguousarray(g2u[::-1,::-1]), np.ascontiguousarray(g2d[::-1,::-1]),
+            np.ascontiguousarray(G2[::-1,::-1,::-1,::-1]))
+
+
+def _rotations(thetas):
+    # two orbital rotations u[k] = [[cos, sin], [-sin, cos]] for every angle thetas[k]
+    c = np.cos(thetas)
+    s = np.sin(thetas)
+    return np.stack([np.stack([c,s],axis=-1),np.stack([-s,c],axis=-1)],axis=1)
+
+
+def _jac_cost_batch_np(u,g2u,g2d,G2,mask):
+    # u has shape (K,2,2); row a of u[k] is the rotated orbital a in the basis of (i,j)
+    K = len(u)
+    uu = (u[:,:,:,None]*u[:,:,None,:]).reshape(K,2,4)
+    nu = uu @ g2u.reshape(4)
+    nd = uu @ g2d.reshape(4)
+    nn = np.sum((uu @ G2.reshape(4,4))*uu, axis=-1)
+    spec = np.array([1-nu-nd+nn,nu-nn,nd-nn,nn])
+    return shannon_batch(spec)[:,mask].sum(axis=-1)
+
+
+if njit is not None:
+
+    @njit(fastmath=True, cache=True, nogil=True)
+    def _jac_cost_core(u1,a,g2u,g2d,G2):
+        # occupations nu, nd and double occupation nn of the rotated orbital a,
+        # accumulated in the precision of the inputs
+        nu = u1.dtype.type(0)
+        nd = u1.dtype.type(0)
+        nn = u1.dtype.type(0)
+        for m in range(2):
+            for n in range(2):
+                w = u1[a,m]*u1[a,n]
+                nu += w*g2u[m,n]
+                nd += w*g2d[m,n]
+                for p in range(2):
+                    for q in range(2):
+                        nn += w*u1[a,p]*u1[a,q]*G2[m,n,p,q]
+        return nu, nd, nn
+
+    @njit(fastmath=True, cache=True, nogil=True)
+    def _jac_cost_batch_jit(u,g2u,g2d,G2,mask):
+        K = u.shape[0]
+        cost = np.zeros(K, u.dtype)
+        one = u.dtype.type(1)
+        for k in range(K):
+            c = cost[k]
+            for a in range(2):
+                if mask[a]:
+                    nu, nd, nn = _jac_cost_core(u[k],a,g2u,g2d,G2)
+                    for x in (one-nu-nd+nn, nu-nn, nd-nn, nn):
+                        if x > 0:
+                            c -= x*np.log(x)
+            cost[k] = c
+        return cost
+
+    @njit(cache=True, nogil=True)
+    def _jac_cost_derivs(thetas,g2u,g2d,G2,mask):
+        # pair cost and its first and second derivative wrt the rotational angle, nan where an eigenvalue
+        # of an orbital RDM is not positive (compiled without fastmath, which would assume there are no nans)
+        K = thetas.shape[0]
+        cost = np.zeros(K)
+        grad = np.zeros(K)
+        hess = np.zeros(K)
+        u = np.empty(2)
+        du = np.empty(2)
+        for k in range(K):
+            c = np.cos(thetas[k])
+            s = np.sin(thetas[k])
+            for a in range(2):
+                if not mask[a]:
+                    continue
+                # row a of the rotation and its derivative, d2u/dtheta2 = -u
+                if a == 0:
+                    u[0], u[1], du[0], du[1] = c, s, -s, c
+                else:
+                    u[0], u[1], du[0], du[1] = -s, c, -c, -s
+                nu = dnu = d2nu = nd = dnd = d2nd = nn = dnn = d2nn = 0.
+                for m in range(2):
+                    for n in range(2):
+                        w = u[m]*u[n]
+                        dw = du[m]*u[n] + u[m]*du[n]
+                        d2w = 2*(du[m]*du[n] - w)
+                        nu += w*g2u[m,n]
+                        dnu += dw*g2u[m,n]
+                        d2nu += d2w*g2u[m,n]
+                        nd += w*g2d[m,n]
+                        dnd += dw*g2d[m,n]
+                        d2nd += d2w*g2d[m,n]
+                        for p in range(2):
+                            for q in range(2):
+                                v = u[p]*u[q]
+                                dv = du[p]*u[q] + u[p]*du[q]
+                                d2v = 2*(du[p]*du[q] - v)
+                                nn += w*v*G2[m,n,p,q]
+                                dnn += (dw*v + w*dv)*G2[m,n,p,q]
+                                d2nn += (d2w*v + 2*dw*dv + w*d2v)*G2[m,n,p,q]
+                for x, dx, d2x in ((1-nu-nd+nn, -dnu-dnd+dnn, -d2nu-d2nd+d2nn),
+                                   (nu-nn, dnu-dnn, d2nu-d2nn), (nd-nn, dnd-dnn, d2nd-d2nn), (nn, dnn, d2nn)):
+                    if x > 0:
+                        logx = np.log(x)
+                        cost[k] -= x*logx
+                        grad[k] -= dx*logx
+                        hess[k] -= d2x*logx + dx*dx/x
+                    else:
+                        cost[k] = np.nan
+                        grad[k] = np.nan
+                        hess[k] = np.nan
+        return cost, grad, hess
+
+    @njit(cache=True, nogil=True)
+    def _newton_polish(t,lo,hi,g2u,g2d,G2,mask,tol=1e-10,max_iter=50):
+        # safeguarded Newton iterations on the roots of the derivative inside the brackets [lo[b], hi[b]]
+        # starting from t[b], bisects wherever a step would leave its bracket; None if the derivative is undefined
+        t = t.copy()
+        cost = np.zeros(len(t))
+        tb = np.zeros(1)
+        for b in range(len(t)):
+            lb, hb = lo[b], hi[b]
+            tb[0] = t[b]
+            for it in range(max_iter):
+                c, grad, hess = _jac_cost_derivs(tb,g2u,g2d,G2,mask)
+                if not np.isfinite(hess[0]):
+                    return None
+                t[b], cost[b] = tb[0], c[0]
+                if grad[0] < 0:
+                    lb = t[b]
+                else:
+                    hb = t[b]
+                tb[0] = (lb+hb)/2
+                if hess[0] > 0 and lb <= t[b] - grad[0]/hess[0] <= hb:
+                    tb[0] = t[b] - grad[0]/hess[0]
+                if abs(tb[0]-t[b]) < tol:
+                    break
+        return t, cost
+
+
+# batched pair cost, compiled with numba when available
+_jac_cost_batch = _jac_cost_batch_np if njit is None else _jac_cost_batch_jit
+
+
+def jacobi_transform(gamma,Gamma,i,j,t,gamma_out=None,Gamma_out=None,buf=None):
 
     '''
     Perform two-orbital rotation to 1- and 2RDM between orbital i and j by angle t
@@ -70,51 +261,51 @@ def jacobi_transform(gamma,Gamma,i,j,t):
         Gamma (ndarray): current 2RDM
         i,j (int): orbital indices
         t (float): rotational angle
+        gamma_out (ndarray): preallocated output for the 1RDM, can be gamma itself for an in-place update
+        Gamma_out (ndarray): preallocated output for the 2RDM, can be Gamma itself for an in-place update
+        buf (ndarray): preallocated work array of shape (2,2,no,no,no), allocated on every call if not given
 
     Returns:
         gamma_ (ndarray): transformed 1RDM
         Gamma_ (ndarray): transformed 2RDM
     '''
 
-    no = len(Gamma)
     u1 = np.array([[np.cos(t),np.sin(t)],[-np.sin(t),np.cos(t)]])
-    U1 = np.eye(no)
-    U1[i,i] = u1[0,0]
-    U1[i,j] = u1[0,1]
-    U1[j,i] = u1[1,0]
-    U1[j,j] = u1[1,1]
-    #print(U1)
-    gamma_ = np.zeros((2*no,2*no))
-    Gamma_ = np.zeros((no,no,no,no))
-
-    Gamma_ = np.einsum('ia,jb,kc,ld,abcd->ijkl',U1,U1,U1,U1,Gamma,optimize='optimal')
-        
-    for a in range(no):
-        testa = 0
-        if a == i or a == j:
-            m_list = list(set([a,i,j]))
-            testa = 1
-        else:
-            m_list = [a]
-        for b in range(no):
-            testb = 0
-            if b == i or b == j:
-                n_list = list(set([b,i,j]))
-                testb = 1
-            else:
-                n_list = [b]
-            if testa + testb > 0:
-                for m in m_list:
-                    for n in n_list:
-                        gamma_[2*a,2*b] += U1[a,m]*U1[b,n]*gamma[2*m,2*n]
-                        gamma_[2*a+1,2*b+1] += U1[a,m]*U1[b,n]*gamma[2*m+1,2*n+1]
-            else:
-                gamma_[2*a,2*b] = gamma[2*a,2*b]
-                gamma_[2*a+1,2*b+1] = gamma[2*a+1,2*b+1]
-                    
+    ij = [i,j]
+
+    Gamma_ = _prepare_out(Gamma, Gamma_out)
+    gamma_ = _prepare_out(gamma, gamma_out)
+
+    # only rows/columns i and j are touched by the rotation, they are gathered into and rotated within buf
+    no = len(Gamma_)
+    if buf is None:
+        buf = np.empty((2,2,no,no,no))
+    rows, rot = buf[0], buf[1]
+    for axis in range(4):
+        G = np.moveaxis(Gamma_, axis, 0)
+        np.copyto(rows[0], G[i])
+        np.copyto(rows[1], G[j])
+        np.matmul(u1, rows.reshape(2,-1), out=rot.reshape(2,-1))
+        G[i] = rot[0]
+        G[j] = rot[1]
+
+    for spin in range(2):
+        g = gamma_[spin::2,spin::2]
+        g[ij,:] = u1 @ g[ij,:]
+        g[:,ij] = g[:,ij] @ u1.T
+
     return gamma_, Gamma_
 
-def jacobi_direct(i,j,gamma,Gamma,inactive_indices):
+
+def _prepare_out(a, out):
+    # output array holding a copy of a, nothing to copy for an in-place update
+    if out is None:
+        return a.copy()
+    if out is not a:
+        np.copyto(out, a)
+    return out
+
+def jacobi_direct(i,j,gamma,Gamma,inactive_indices,blocks=None):
     
     '''
 
@@ -125,6 +316,7 @@ def jacobi_direct(i,j,gamma,Gamma,inactive_indices):
         gamma (ndarray): current 1RDM
         Gamma (ndarray): current 2RDM
         inactive_indices (list): indices of inactive orbitals
+        blocks (tuple): precomputed (g2u, g2d, G2) blocks of the RDMs restricted to orbitals i and j
 
     Returns:
         None: if no rotation between orbital i and j can lower the entropy
@@ -132,33 +324,77 @@ def jacobi_direct(i,j,gamma,Gamma,inactive_indices):
 
     '''
 
-    cost = jacobi_cost(0,i,j,gamma,Gamma,inactive_indices)
-    test = 0
+    if blocks is None:
+        blocks = _pair_blocks(i,j,gamma,Gamma)
+    mask = np.array([i in inactive_indices, j in inactive_indices])
+
+    if njit is None:
+        # without numba a batched scan is cheaper than an iterative root polish
+        return _jacobi_grid(blocks,mask)
+
+    # the cost is pi-periodic, bracket its minima on a coarse grid and polish them with newton steps
+    ts = np.linspace(0, np.pi, 9)
+    costs, grad, _ = _jac_cost_derivs(ts,*blocks,mask)
+    k = np.nonzero((grad[:-1] < 0) & (grad[1:] > 0))[0]
+    polished = None
+    if np.all(np.isfinite(grad)):
+        # start from the secant roots of the derivative in every bracket
+        t0 = ts[k] - grad[k]*(ts[k+1]-ts[k])/(grad[k+1]-grad[k])
+        polished = _newton_polish(t0,ts[k],ts[k+1],*blocks,mask)
+    if polished is None:
+        # derivative is undefined where an eigenvalue of an orbital RDM is not positive
+        return _jacobi_grid(blocks,mask)
+    ts = np.concatenate((ts,polished[0]))
+    costs = np.concatenate((costs,polished[1]))
+
+    k = np.argmin(costs)
+    if costs[0] > costs[k] + 1e-8:
+        return ts[k]
+    else:
+        return None
+
+
+def _jacobi_grid(blocks,mask):
+    # brute force scan of the rotational angle on a coarse and a fine grid
+    g2u, g2d, G2 = blocks
+
+    # coarse scan in single precision, only the position of its minimum is used
     grid = 0.01
-    t_opt = 0
-    for t in np.arange(grid, np.pi, grid):
-        new_cost = jacobi_cost(t,i,j,gamma,Gamma,inactive_indices)
-        if cost > new_cost:
-            #test = 1
-            t_opt = t
-            cost = new_cost
-    small_grid = 0.0001
+    ts = np.concatenate(([0.],np.arange(grid, np.pi, grid)))
+    blocks32 = [b.astype(np.float32) for b in blocks]
+    costs = _jac_cost_batch(_rotations(ts).astype(np.float32),*blocks32,mask)
+    k = np.argmin(costs)
+    t_opt = ts[k]
+    cost = _jac_cost_batch(_rotations(ts[k:k+1]),g2u,g2d,G2,mask)[0]
     if t_opt == 0:
         t_opt += grid
-    
-    for t in np.arange(t_opt-grid,t_opt+grid,small_grid):
-        new_cost = jacobi_cost(t,i,j,gamma,Gamma,inactive_indices)
-        if cost > new_cost + 1e-8:
-            test = 1
-            t_opt_new = t
-            cost = new_cost
-    if test == 1:
-        return t_opt_new
+
+    # fine scan around the coarse minimum
+    small_grid = 0.0001
+    ts = np.arange(t_opt-grid,t_opt+grid,small_grid)
+    costs = _jac_cost_batch(_rotations(ts),g2u,g2d,G2,mask)
+    k = np.argmin(costs)
+    if cost > costs[k] + 1e-8:
+        return ts[k]
     else:
         return None
 
 
-def minimize_orb_corr_jacobi(gamma,Gamma,inactive_indices,max_cycle):
+def _pair_rounds(orb_list):
+    # round-robin schedule: split all pairs of orb_list into rounds of pairs sharing no orbital
+    orbs = list(orb_list)
+    if len(orbs) % 2:
+        orbs.append(None)
+    n = len(orbs)
+    rounds = []
+    for r in range(n-1):
+        rounds.append([(orbs[k],orbs[n-1-k]) for k in range(n//2)
+                       if orbs[k] is not None and orbs[n-1-k] is not None])
+        orbs = [orbs[0], orbs[-1]] + orbs[1:-1]
+    return rounds
+
+
+def minimize_orb_corr_jacobi(gamma,Gamma,inactive_indices,max_cycle,n_threads=1):
     
     '''
 
@@ -169,6 +405,8 @@ def minimize_orb_corr_jacobi(gamma,Gamma,inactive_indices,max_cycle):
         Gamma (ndarray): initial 2RDM
         inactive_indices (list): inactive orbital indices
         max_cycle (int): maximal number of cycles of jacobi rotation during orbital optimization
+        n_threads (int): number of threads evaluating the independent orbital pairs of a round,
+            the pair kernels release the GIL only when numba is installed
 
     Returns:
         rotations (list): history of jacobi rotations (orbital_i, orbital_j, rotational_angle)
@@ -181,63 +419,83 @@ def minimize_orb_corr_jacobi(gamma,Gamma,inactive_indices,max_cycle):
 
 
     no = len(Gamma) 
-    gamma0 = copy.deepcopy(gamma) # get_1_pt_rdm_molpro(state,no)
-    Gamma0 = copy.deepcopy(Gamma) # get_rel_2_pt_rdm_molpro(state,no)
+    gamma0 = gamma.copy() # get_1_pt_rdm_molpro(state,no)
+    Gamma0 = Gamma.copy() # get_rel_2_pt_rdm_molpro(state,no)
     
 
-    def jacobi_step(t,i,j):
-        V = np.eye(no)
-        V[i,i] = np.cos(t)
-        V[i,j] = np.sin(t)
-        V[j,i] = -np.sin(t)
-        V[j,j] = np.cos(t)
-        return V
-
     # Initialize a small rotation
     X = (np.random.rand(no,no)/2-1)/1/(1+49*np.random.rand())
     X = X - X.T
-    U = expm(X)
-    U_ = np.kron(U,np.eye(2))
-    gamma0 = np.einsum('ia,jb,ab->ij',U_,U_,gamma0,optimize='optimal')
+    # Cayley transform, orthogonal for antisymmetric X
+    U = np.linalg.solve(np.eye(no)+X, np.eye(no)-X)
+    # U acts identically on both spins, the 1RDM has no spin-off-diagonal blocks
+    assert np.allclose(gamma0[0::2,1::2], 0) and np.allclose(gamma0[1::2,0::2], 0)
+    gu, gd = split_spin(gamma0)
+    gamma0 = merge_spin(U @ gu @ U.T, U @ gd @ U.T)
     Gamma0 = np.einsum('ia,jb,kc,ld,abcd->ijkl',U,U,U,U,Gamma0,optimize='optimal')
 
 
     rotations = []
+    # RDM blocks of the orbital pairs (i<j), only invalidated when one of the two orbitals is rotated
+    slice_cache = {}
+    # cached pairs of every orbital
+    orb_keys = [set() for _ in range(no)]
+
+    def cached_blocks(i,j):
+        key = (int(min(i,j)), int(max(i,j)))
+        if key not in slice_cache:
+            slice_cache[key] = _pair_blocks(*key,gamma0,Gamma0)
+            for k in key:
+                orb_keys[k].add(key)
+        blocks = slice_cache[key]
+        return blocks if i < j else _swap_pair_blocks(blocks)
 
     logger.info('Optimizig Orbitals...')
-    cost = 100
     new_cost = 100
     cycle_cost = 100
-    for n in range(max_cycle):
-        logger.info('============== Cycle '+str(n+1)+' ==============')
-        orb_list = np.arange(0,no)
-        np.random.shuffle(orb_list)
-        for a in range(no):
-            i = orb_list[a]
-            for b in range(a):
-                j = orb_list[b]
-                if (i in inactive_indices) or (j in inactive_indices):
-                    
-                    t = jacobi_direct(i,j,gamma0,Gamma0,inactive_indices)
-                    
+    # threads are only started when the pool is used
+    buf = np.empty((2,2,no,no,no))
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        pair_map = executor.map if n_threads > 1 else map
+        for n in range(max_cycle):
+            logger.info('============== Cycle %d ==============', n+1)
+            orb_list = np.arange(0,no)
+            np.random.shuffle(orb_list)
+            # pairs within one round share no orbital, so their rotations are independent
+            for pairs in _pair_rounds(orb_list):
+                pairs = [(i,j) for i,j in pairs if (i in inactive_indices) or (j in inactive_indices)]
+                blocks = [cached_blocks(i,j) for i,j in pairs]
+
+                def direct(pair, blocks):
+                    return jacobi_direct(*pair,gamma0,Gamma0,inactive_indices,blocks=blocks)
+
+                angles = list(pair_map(direct, pairs, blocks))
+
+                for (i,j), t in zip(pairs, angles):
                     if t != None:
                         #print('t=',t)
-                        gamma0, Gamma0 = jacobi_transform(gamma0,Gamma0,i,j,t)
-                        new_cost = get_cost_fqi(gamma0,Gamma0,inactive_indices)
-                        #print(i,j,'cost =',new_cost)
-                        advance = cost - new_cost
-                        cost = new_cost
-                        U = np.matmul(jacobi_step(t,i,j),U)
+                        jacobi_transform(gamma0,Gamma0,i,j,t,gamma_out=gamma0,Gamma_out=Gamma0,buf=buf)
+                        for key in orb_keys[i] | orb_keys[j]:
+                            del slice_cache[key]
+                            for k in key:
+                                orb_keys[k].discard(key)
+                        # the rotation only mixes rows i and j of U
+                        c, sn = np.cos(t), np.sin(t)
+                        ui, uj = U[i].copy(), U[j]
+                        U[i] = c*ui + sn*uj
+                        U[j] = -sn*ui + c*uj
                         rotations.append([i+1,j+1,t/np.pi*180])
                         #print(gamma0)
+                if any(t != None for t in angles):
+                    new_cost = get_cost_fqi(gamma0,Gamma0,inactive_indices)
                     
         
-        tol = 1e-7
-        if cycle_cost - new_cost < tol:
-            logger.info('reached tol =',tol)
-            break
-        cycle_cost = new_cost
-        logger.info('cost=',cycle_cost)
+            tol = 1e-7
+            if cycle_cost - new_cost < tol:
+                logger.info('reached tol = %e', tol)
+                break
+            cycle_cost = new_cost
+            logger.info('cost = %s', cycle_cost)
 
     return rotations, U, gamma0, Gamma0
 
@@ -260,46 +518,46 @@ def reorder_fast(gamma, Gamma, n_cas, n_core):
     """
     n_orb = len(Gamma) 
     i = np.arange(n_orb, dtype=int)
-    nu = gamma[2*i,2*i]
-    nd = gamma[2*i+1,2*i+1]
+    nu = gamma.diagonal()[0::2]
+    nd = gamma.diagonal()[1::2]
     nn = Gamma[i,i,i,i]
     occ_num = nu + nd
     spec = np.array([1-nu-nd+nn, nu-nn, nd-nn, nn])
     s_val = -np.sum(np.log(spec)*spec, axis=0)
     s_val_init = s_val.copy()
     inds = np.argsort(s_val)[::-1]
-    # get the permutation matrix for the above sorting
-    P = np.eye(n_orb)[inds]
+    # keep track of the permutation as an index vector
+    perm = inds
     s_val = s_val[inds]
     occ_num = occ_num[inds]
 
     # sort the inactive orbitals wrt to occupation numbers
     inds_inactive = np.argsort(occ_num[n_cas:])[::-1]
-    # get the permutation matrix for the above sorting
     inds = np.concatenate((np.arange(n_cas, dtype=int), (n_cas+inds_inactive)))
-    P = P[inds]
+    perm = perm[inds]
     s_val = s_val[inds]
     occ_num = occ_num[inds]
 
     # sort the active orbitals wrt to occupation numbers
     inds_active = np.argsort(occ_num[:n_cas])[::-1]
-    # get the permutation matrix for the above sorting
     inds = np.concatenate((inds_active, np.arange(n_cas, n_orb, dtype=int)))
-
+    perm = perm[inds]
     s_val = s_val[inds]
     occ_num = occ_num[inds]
-    P = P[inds]
 
     # move the first N_core orbitals to the front
-    inds =  [i for i in range(n_cas, n_cas+n_core)]+[i for i in range(n_cas)] + [i for i in range(n_cas+n_core, n_orb)]
-    P = P[inds]
+    inds = np.concatenate((np.arange(n_cas, n_cas+n_core), np.arange(n_cas), np.arange(n_cas+n_core, n_orb)))
+    perm = perm[inds]
     s_val = s_val[inds]
     occ_num = occ_num[inds]
-    logger.info("Orbital entropies =", str(s_val))
-    logger.info("Orbital occupation numbers =", str(occ_num))
+    logger.info("Orbital entropies = %s", s_val)
+    logger.info("Orbital occupation numbers = %s", occ_num)
     if occ_num[n_core+n_cas-1] < occ_num[n_core+n_cas]:
         logger.info("Warning: the orbitals are not ordered correctly wrt to occupation numbers!")
-    assert np.allclose(P @ s_val_init, s_val)
+    assert np.array_equal(s_val_init[perm], s_val)
+
+    # get the permutation matrix for the above sorting
+    P = np.eye(n_orb)[perm]
 
     return P
 
@@ -310,8 +568,8 @@ def reorder_occ(gamma, Gamma):
     """
     n_orb = len(Gamma) 
     i = np.arange(n_orb, dtype=int)
-    nu = gamma[2*i,2*i]
-    nd = gamma[2*i+1,2*i+1]
+    nu = gamma.diagonal()[0::2]
+    nd = gamma.diagonal()[1::2]
     nn = Gamma[i,i,i,i]
     occ_num = nu + nd
     spec = np.array([1-nu-nd+nn, nu-nn, nd-nn, nn])
@@ -321,10 +579,8 @@ def reorder_occ(gamma, Gamma):
     s_val = s_val[inds]
     occ_num = occ_num[inds]
     
-    logger.info("Orbital entropies =")
-    logger.info(s_val)
-    logger.info("Orbital occupation numbers =")
-    logger.info(str(occ_num))
+    logger.info("Orbital entropies = %s", s_val)
+    logger.info("Orbital occupation numbers = %s", occ_num)
 
     return P, s_val, occ_num
 
@@ -351,72 +607,46 @@ def reorder(gamma,Gamma,N_cas):
 
     '''
 
-    test = 1
     #S1 = orb_corr(gamma,Gamma)
-    S1 = np.zeros(len(Gamma))
-    N1 = np.zeros(len(Gamma))
-    for i in range(len(Gamma)):
-        nu = gamma[2*i,2*i]
-        nd = gamma[2*i+1,2*i+1]
-        N1[i] = nu + nd
-        spec = [1-nu,nu,1-nd,nd]
-        S1[i] = shannon(spec)
+    nu = gamma.diagonal()[0::2]
+    nd = gamma.diagonal()[1::2]
+    # negative entries (numerical noise) do not contribute, as in shannon
+    spec = np.clip([1-nu,nu,1-nd,nd], 0, None)
+    S1 = -xlogy(spec,spec).sum(axis=0)
+    N1 = nu + nd
     #print(S1,N1)
-    rotations = []
     no = len(S1)
-    V = np.eye(no)
-    
-    while test == 1:
-        test = 0
-        for i in range(len(S1)-1):
-            if S1[i] < S1[i+1]:
-                test = 1
-
-                c = S1[i]
-                S1[i] = S1[i+1]
-                S1[i+1] = c
-
-
-                c = N1[i]
-                N1[i] = N1[i+1]
-                N1[i+1] = c
-
-                rotations = rotations + [[i+1,i+2,0]]
-                V_ = np.eye(no)
-                V_[i,i] = 0
-                V_[i+1,i+1] = 0
-                V_[i,i+1] = 1
-                V_[i+1,i] = 1
-                V = np.matmul(V_,V)
-    
-    
-    n_closed = 0
-    for j in range(N_cas,len(S1)):
-        if N1[j] > 1:
-            n_closed += 1
-            for i in range(j):
-                #print(i)
-
-                c = S1[j-1-i]
-                S1[j-1-i] = S1[j-i]
-                S1[j-i] = c
 
+    # sort wrt to entropy (descending, stable)
+    order = np.argsort(-S1, kind='stable')
+    rotations = _adjacent_swaps(order)
 
-                c = N1[j-1-i]
-                N1[j-1-i] = N1[j-i]
-                N1[j-i] = c
+    # move the inactive orbitals with more than one electron to the front
+    closed = np.zeros(no, dtype=bool)
+    closed[N_cas:] = N1[order][N_cas:] > 1
+    n_closed = int(np.sum(closed))
+    for j in np.flatnonzero(closed).tolist():
+        rotations += [[j-i,j-i+1,0] for i in range(j)]
+    order = order[np.concatenate((np.flatnonzero(closed)[::-1], np.flatnonzero(~closed)))]
 
-                rotations = rotations + [[j-i,j-i+1,0]]
-                V_ = np.eye(no)
-                V_[j-1-i,j-1-i] = 0
-                V_[j-i,j-i] = 0
-                V_[j-1-i,j-i] = 1
-                V_[j-i,j-1-i] = 1
-                V = np.matmul(V_,V)
+    S1 = S1[order]
+    N1 = N1[order]
+    V = np.eye(no)[order]
 
 
-    logger.info(S1,N1)
-    logger.info('n_closed =',n_closed)
+    logger.info("Orbital entropies = %s", S1)
+    logger.info("Orbital occupation numbers = %s", N1)
+    logger.info('n_closed = %d', n_closed)
     return rotations, n_closed, V
 
 
+def _adjacent_swaps(order):
+    # decompose the permutation order into swaps of neighbouring orbitals [k,k+1,0] (1-based)
+    cur = list(range(len(order)))
+    swaps = []
+    for p, o in enumerate(order):
+        k = cur.index(o)
+        for m in range(k, p, -1):
+            cur[m-1], cur[m] = cur[m], cur[m-1]
+            swaps.append([m,m+1,0])
+    return swaps
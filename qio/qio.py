@@ -17,6 +17,8 @@ class QIO:
             n_core (int): number of core orbitals
             no (int): number of non-frozen orbitals
             max_cycle (int): max number of cycle of jacobi rotations
+            n_threads (int): number of threads for evaluating jacobi rotations (only pays off with numba,
+                whose kernels release the GIL)
             level_shift (float): level shift in the diagonal hessian for orbital optimization
             max_M (int): max bond dimension in DMRG
         
@@ -33,6 +35,7 @@ class QIO:
         self.active_indices = np.array(list(range(self.n_core, self.n_core+self.n_cas)))
         self.sol = sol
         self.max_cycle = 100
+        self.n_threads = 1
         self.thresh = 1e-4
         self.level_shift = 1e-3
         self.step_size = 1.
@@ -133,7 +136,8 @@ class QIO:
         
         if method.upper() == '2D_JACOBI' or method.upper() == '2DJACOBI' or method.upper() == 'JACOBI':
             # Orbital rotation block
-            _,U,self.gamma,self.Gamma = minimize_orb_corr_jacobi(gamma, Gamma, inactive_indices, self.max_cycle)
+            _,U,self.gamma,self.Gamma = minimize_orb_corr_jacobi(gamma, Gamma, inactive_indices, self.max_cycle,
+                                                                n_threads=self.n_threads)
         elif method.upper() == 'NEWTON-RAPHSON' or method.upper() == 'NEWTON_RAPHSON' or method.upper() == 'NEWTON' or method.upper() == 'NR':
             U, self.gamma, self.Gamma, self.mu = minimize_orb_corr_GD(gamma, Gamma, inactive_indices, self.active_indices, 
                                                            thresh=self.thresh, max_cycle=self.max_cycle, step_size=self.step_size,
@@ -2,8 +2,8 @@
 """
 This file is based on the example from pyscf/examples/cc/04-tailored-ccsd.py
 """
-from functools import partial
 import numpy as np
+from opt_einsum import contract_expression
 import pyscf
 import pyscf.gto
 import pyscf.scf
@@ -12,8 +12,6 @@ from pyscf.ci import cisd
 import pyscf.mcscf
 from pyscf.mp.mp2 import _mo_without_core
 
-einsum = partial(np.einsum, optimize=True)
-
 class TCCSD:
     def __init__(self, mf, mc):
         """
@@ -109,6 +107,22 @@ def make_tailored_ccsd(cc, mc):
     pvir = np.linalg.multi_dot((mo_cc_vir.T, ovlp, mo_cas_vir))
     is_good_ref = True
 
+    # Contraction expressions of the CAS<->CCSD projections, reused in every CCSD iteration
+    nvir_cc = pvir.shape[0]
+    nvir_cas = pvir.shape[1]
+    poccT = pocc.T.copy()
+    pvirT = pvir.T.copy()
+    t1_cc = (nocc_cc, nvir_cc)
+    t2_cc = (nocc_cc, nocc_cc, nvir_cc, nvir_cc)
+    t1_cas = (nocc_cas, nvir_cas)
+    t2_cas = (nocc_cas, nocc_cas, nvir_cas, nvir_cas)
+    expr_t1_fwd = contract_expression('IA,Ii,Aa->ia', t1_cc, pocc.shape, pvir.shape, optimize='optimal')
+    expr_t2_fwd = contract_expression('IJAB,Ii,Jj,Aa,Bb->ijab', t2_cc, pocc.shape, pocc.shape,
+                                      pvir.shape, pvir.shape, optimize='optimal')
+    expr_t1_bwd = contract_expression('ia,iI,aA->IA', t1_cas, poccT.shape, pvirT.shape, optimize='optimal')
+    expr_t2_bwd = contract_expression('ijab,iI,jJ,aA,bB->IJAB', t2_cas, poccT.shape, poccT.shape,
+                                      pvirT.shape, pvirT.shape, optimize='optimal')
+
     def find_ref_det(mc):
         """
         Identifies the dominant det in the CASCI solution. 
@@ -150,26 +164,26 @@ def make_tailored_ccsd(cc, mc):
             is_good_ref = False
             print("Warning: |C0| = %.4e is too small for TCCSD. Current orbitals are a bad guess!" % np.abs(c0))
         t1 = c1/c0
-        t2 = c2/c0 - einsum('ia,jb->ijab', t1, t1)
+        t2 = c2/c0 - t1[:,None,:,None] * t1[None,:,None,:]
         return t1, t2, is_good_ref
 
     t1cas_fci, t2cas_fci, is_good_ref = get_cas_t1t2(mc)
-    t1_init = einsum('ia,Ii,Aa->IA', t1cas_fci, pocc, pvir)
-    t2_init = einsum('ijab,Ii,Jj,Aa,Bb->IJAB', t2cas_fci, pocc, pocc, pvir, pvir)
+    t1_init = expr_t1_bwd(t1cas_fci, poccT, pvirT)
+    t2_init = expr_t2_bwd(t2cas_fci, poccT, poccT, pvirT, pvirT)
 
     def callback(kwargs):
         """Tailor CCSD amplitudes within CAS."""
         t1, t2 = kwargs['t1new'], kwargs['t2new']
         # Project CCSD amplitudes onto CAS:
-        t1cas_cc = einsum('IA,Ii,Aa->ia', t1, pocc, pvir)
-        t2cas_cc = einsum('IJAB,Ii,Jj,Aa,Bb->ijab', t2, pocc, pocc, pvir, pvir)
+        t1cas_cc = expr_t1_fwd(t1, pocc, pvir)
+        t2cas_cc = expr_t2_fwd(t2, pocc, pocc, pvir, pvir)
         #assert np.allclose(t1cas_cc, t1[cas.ncore:cas.ncore+nocc_cas, :cas.ncas-nocc_cas])
         # Take difference FCI-CCSD within CAS:
         dt1 = (t1cas_fci - t1cas_cc)
         dt2 = (t2cas_fci - t2cas_cc)
         # Rotate difference to CCSD space:
-        dt1 = einsum('ia,Ii,Aa->IA', dt1, pocc, pvir)
-        dt2 = einsum('ijab,Ii,Jj,Aa,Bb->IJAB', dt2, pocc, pocc, pvir, pvir)
+        dt1 = expr_t1_bwd(dt1, poccT, pvirT)
+        dt2 = expr_t2_bwd(dt2, poccT, poccT, pvirT, pvirT)
         # Add difference:
         t1 += dt1
         t2 += dt2
@@ -184,7 +198,7 @@ def make_tailored_ccsd(cc, mc):
         #assert np.allclose(t2cas_fci, t2[ind0:ind1, ind0:ind1, :ind2, :ind2])
         c0 = 1.
         c1 = t1.copy()
-        c2 = t2 + einsum('ia,jb->ijab', t1, t1) 
+        c2 = t2 + t1[:,None,:,None] * t1[None,:,None,:]
         mycisd = cisd.CISD(cc._scf)
         cisdvec = pyscf.ci.cisd.amplitudes_to_cisdvec(c0, c1, c2)
         cisdvec /= np.linalg.norm(cisdvec)
@@ -195,7 +209,7 @@ def make_tailored_ccsd(cc, mc):
         t1, t2 = cc.t1, cc.t2
         c0 = 1.
         c1 = t1
-        c2 = t2 + einsum('ia,jb->ijab', t1, t1) 
+        c2 = t2 + t1[:,None,:,None] * t1[None,:,None,:]
         mycisd = cisd.CISD(cc._scf)
         cisdvec = pyscf.ci.cisd.amplitudes_to_cisdvec(c0, c1, c2)
         cisdvec /= np.linalg.norm(cisdvec)
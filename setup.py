@@ -7,9 +7,13 @@ setup(
     install_requires=[
         'numpy',
         'scipy',
+        'opt_einsum',
         'pyscf',
         'block2'
     ],
+    extras_require={
+        'numba': ['numba'],
+    },
     author='Ke Liao & Lexin Ding',
     author_email='ke.liao.whu@gmail.com',
     description='Quantum information-based orbital optimization for quantum chemistry calculations.',